@@ -0,0 +1,253 @@
+"""
+Admission control and load shedding for the Flask API
+Per-endpoint concurrency limits, bounded queues, per-client rate limiting
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, jsonify, request
+
+
+class TokenBucket:
+    """Per-client token bucket rate limiter, capped at max_clients buckets"""
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def allow(self, client_id):
+        """Take one token - returns (allowed, retry_after_seconds)"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.pop(client_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+            # Least recently seen clients go first once the cap is reached
+            while len(self.buckets) >= self.max_clients:
+                self.buckets.popitem(last=False)
+
+            if tokens >= 1:
+                self.buckets[client_id] = (tokens - 1, now)
+                return True, 0
+
+            self.buckets[client_id] = (tokens, now)
+            return False, (1 - tokens) / self.rate
+
+
+class EndpointLimiter:
+    """Concurrency limit with a bounded, deadline-aware wait queue"""
+
+    def __init__(self, name, max_concurrent, max_queue):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.avg_service_time = 0.0
+        self.served = 0
+        self.shed = 0
+        self.last_shed = None
+
+    def estimated_wait(self):
+        """Expected queueing delay for a request arriving now"""
+        if self.in_flight < self.max_concurrent and self.queued == 0:
+            return 0.0
+        return (self.queued + 1) * self.avg_service_time / self.max_concurrent
+
+    def retry_after(self):
+        """Whole seconds a shed client should wait before retrying"""
+        return max(1, math.ceil(self.estimated_wait()))
+
+    def acquire(self, deadline):
+        """Wait for a slot until deadline (monotonic) - False if shed"""
+        with self.cond:
+            if self.in_flight < self.max_concurrent and self.queued == 0:
+                self.in_flight += 1
+                return True
+
+            # Shed fast instead of queueing work that cannot finish in time
+            if self.queued >= self.max_queue or self.estimated_wait() > deadline - time.monotonic():
+                self._record_shed()
+                return False
+
+            self.queued += 1
+            try:
+                while self.in_flight >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._record_shed()
+                        return False
+                    self.cond.wait(remaining)
+                self.in_flight += 1
+                return True
+            finally:
+                self.queued -= 1
+
+    def release(self, elapsed):
+        """Free a slot and fold elapsed time into the service time average"""
+        with self.cond:
+            self.in_flight -= 1
+            self.served += 1
+            if self.avg_service_time == 0:
+                self.avg_service_time = elapsed
+            else:
+                self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * elapsed
+            self.cond.notify()
+
+    def _record_shed(self):
+        self.shed += 1
+        self.last_shed = time.monotonic()
+
+    def utilization(self):
+        """Busy slots plus waiting requests, relative to the concurrency limit"""
+        return (self.in_flight + self.queued) / self.max_concurrent
+
+    def snapshot(self):
+        """Current limiter state for health reporting"""
+        return {
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'utilization': round(self.utilization(), 2),
+            'avg_service_ms': round(self.avg_service_time * 1000, 1),
+            'served': self.served,
+            'shed': self.shed
+        }
+
+
+class AdmissionController:
+    """Applies rate limits and per-endpoint concurrency limits to routes"""
+
+    def __init__(self, limits, rate, burst, queue_timeout, degrade_at=0.75, shed_window=5):
+        self.limiters = {
+            name: EndpointLimiter(name, max_concurrent, max_queue)
+            for name, (max_concurrent, max_queue) in limits.items()
+        }
+        self.rate_limiter = TokenBucket(rate, burst)
+        self.queue_timeout = queue_timeout
+        self.degrade_at = degrade_at
+        self.shed_window = shed_window
+        # Switched off by replay.py so replays don't shed or degrade themselves
+        self.enabled = True
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build a controller from ADMISSION_* environment variables
+        Defaults are sized from WORKER_THREADS: running and queued requests
+        both hold a thread, and ADMISSION_HEADROOM threads stay free for
+        /api/health and the unlimited routes
+        """
+        threads = int(os.getenv('WORKER_THREADS', 32))
+        headroom = int(os.getenv('ADMISSION_HEADROOM', 2))
+        budget = threads - headroom
+
+        parse = int(os.getenv('ADMISSION_PARSE_CONCURRENCY', max(1, budget // 8)))
+        discover = int(os.getenv('ADMISSION_DISCOVER_CONCURRENCY', max(1, budget // 4)))
+        checkout = int(os.getenv('ADMISSION_CHECKOUT_CONCURRENCY', max(1, budget // 8)))
+        queue = int(os.getenv('ADMISSION_MAX_QUEUE', max(1, (budget - parse - discover - checkout) // 3)))
+
+        total = parse + discover + checkout + 3 * queue
+        if total > budget:
+            raise ValueError(
+                f"Admission limits need {total} threads but only {budget} of "
+                f"WORKER_THREADS={threads} are available after {headroom} headroom"
+            )
+
+        return cls(
+            limits={
+                'parse-brief': (parse, queue),
+                'discover-products': (discover, queue),
+                'checkout': (checkout, queue)
+            },
+            rate=float(os.getenv('ADMISSION_RATE_PER_SEC', 5)),
+            burst=float(os.getenv('ADMISSION_BURST', 20)),
+            queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 2.0)),
+            degrade_at=float(os.getenv('ADMISSION_DEGRADE_AT', 0.75))
+        )
+
+    def client_id(self):
+        """
+        Identify the caller by remote address - X-Forwarded-For is only
+        honoured through ProxyFix for the hops set in TRUSTED_PROXY_HOPS
+        """
+        return request.remote_addr or 'unknown'
+
+    def request_deadline(self):
+        """Queue deadline, shortened by an X-Request-Timeout header (seconds)"""
+        timeout = self.queue_timeout
+        try:
+            timeout = min(timeout, float(request.headers.get('X-Request-Timeout', timeout)))
+        except ValueError:
+            pass
+        return time.monotonic() + max(timeout, 0)
+
+    def limit(self, endpoint):
+        """Route decorator - 429 when rate limited, 503 when shed"""
+        limiter = self.limiters[endpoint]
+
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+
+                allowed, retry_after = self.rate_limiter.allow(self.client_id())
+                if not allowed:
+                    return self._reject(429, 'Rate limit exceeded', retry_after, 'rate_limited')
+
+                if not limiter.acquire(self.request_deadline()):
+                    return self._reject(503, 'Server busy, please retry', limiter.retry_after(), 'shed')
+
+                start = time.monotonic()
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    limiter.release(time.monotonic() - start)
+            return wrapped
+        return decorator
+
+    def _reject(self, status, message, retry_after, outcome):
+        # Kept on g so traffic capture can tell rejections from real responses
+        g.admission_outcome = outcome
+        seconds = max(1, math.ceil(retry_after))
+        response = jsonify({'error': message, 'retry_after': seconds})
+        response.status_code = status
+        response.headers['Retry-After'] = str(seconds)
+        return response
+
+    def under_pressure(self):
+        """True when optional work (Gemini parsing) should be skipped"""
+        if not self.enabled:
+            return False
+        return any(l.utilization() >= self.degrade_at for l in self.limiters.values())
+
+    def saturated(self):
+        """True when shedding recently or a queue is at least half full"""
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        for l in self.limiters.values():
+            if l.last_shed is not None and now - l.last_shed < self.shed_window:
+                return True
+            if l.max_queue and l.queued * 2 >= l.max_queue:
+                return True
+        return False
+
+    def snapshot(self):
+        """Saturation report for the health endpoint"""
+        return {
+            'saturation': round(max(l.utilization() for l in self.limiters.values()), 2),
+            'under_pressure': self.under_pressure(),
+            'endpoints': {name: l.snapshot() for name, l in self.limiters.items()}
+        }
@@ -1,29 +1,64 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g
+from werkzeug.middleware.proxy_fix import ProxyFix
+import hmac
 import json
+import time
 from datetime import datetime, timedelta
+from functools import wraps
 import os
 import re
 from dotenv import load_dotenv
 import google.generativeai as genai
+from admission import AdmissionController
+from profiler import SamplingProfiler, stage
+from capture import TrafficRecorder, response_hash
+from feeds import CatalogStore, FeedIngestor
+from gemini import SYSTEM_INSTRUCTION, GeminiUsage, generation_config, truncate_brief
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 
+# Number of proxies in front of the app whose X-Forwarded-For hop we trust
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 0))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
 # Configure Gemini API
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 USE_AI_PARSING = os.getenv('USE_AI_PARSING', 'false').lower() == 'true'
+GEMINI_MAX_BRIEF_TOKENS = int(os.getenv('GEMINI_MAX_BRIEF_TOKENS', 500))
+GEMINI_MAX_OUTPUT_TOKENS = int(os.getenv('GEMINI_MAX_OUTPUT_TOKENS', 256))
+# Checked at startup - a zero limit would make every call fall back to regex
+for name, value in (('GEMINI_MAX_BRIEF_TOKENS', GEMINI_MAX_BRIEF_TOKENS),
+                    ('GEMINI_MAX_OUTPUT_TOKENS', GEMINI_MAX_OUTPUT_TOKENS)):
+    if value <= 0:
+        raise ValueError(f"{name} must be positive, got {value}")
 
 if GEMINI_API_KEY and USE_AI_PARSING:
     genai.configure(api_key=GEMINI_API_KEY)
     # Use fastest free model: gemini-2.0-flash-lite
-    gemini_model = genai.GenerativeModel('gemini-2.0-flash-lite')
+    # Parsing rules live in the system instruction, shared by every call
+    gemini_model = genai.GenerativeModel('gemini-2.0-flash-lite', system_instruction=SYSTEM_INSTRUCTION)
     print("✅ Gemini API Enabled - Using AI-powered parsing")
 else:
     gemini_model = None
     print("ℹ️  Using regex-based parsing (no API key needed)")
 
+# Admission control - concurrency limits, bounded queues, rate limiting
+admission = AdmissionController.from_env()
+
+# Admin endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# On-demand profiler - armed through /api/admin/profiler
+profiler = SamplingProfiler(buffer_size=int(os.getenv('PROFILER_BUFFER_SIZE', 50)))
+
+# Sampled traffic capture for replay.py - off unless TRAFFIC_CAPTURE=true
+traffic_recorder = TrafficRecorder.from_env()
+CAPTURED_PATHS = {'/api/parse-brief', '/api/discover-products', '/api/checkout'}
+
 # Mock retailer data
 RETAILERS = {
     'amazon': {'name': 'Amazon', 'base_delivery': 2},
@@ -66,64 +101,58 @@ PRODUCT_DATABASE = {
     ]
 }
 
+# Schema-constrained JSON output - items limited to known categories
+GEMINI_GENERATION_CONFIG = generation_config(PRODUCT_DATABASE.keys(), GEMINI_MAX_OUTPUT_TOKENS)
+gemini_usage = GeminiUsage()
+
+# Versioned catalog seeded from the constants above, updated by live feeds
+catalog_store = CatalogStore(RETAILERS, PRODUCT_DATABASE)
+feed_ingestor = FeedIngestor.from_env(catalog_store)
+
+
+def start_feed_ingestor():
+    """
+    Start following the feed - only in the process that serves requests
+    (gunicorn post_fork hook, or the reloader child under python app.py)
+    """
+    if feed_ingestor and feed_ingestor.thread is None:
+        feed_ingestor.start()
+        print(f"📡 Live catalog feed: {feed_ingestor.source}")
+
 
 class ShoppingAgent:
     """AI Shopping Agent - Works with OR without Gemini API"""
     
-    def __init__(self):
+    def __init__(self, catalog=None):
         self.spec = None
         self.products = []
         self.use_ai = gemini_model is not None
+        # One catalog snapshot per agent - feed updates never change it mid-request
+        self.catalog = catalog or catalog_store.current
         
     def parse_brief_with_gemini(self, message):
         """
         AI-powered parsing using FREE Gemini API
         Uses gemini-2.0-flash-lite (fastest free model)
+        Rules are a shared system instruction, still sent and billed on every call
         """
-        prompt = f"""You are a shopping assistant. Parse this shopping request into JSON.
-
-User request: "{message}"
-
-Extract the following information and return ONLY valid JSON (no markdown, no explanations):
-
-{{
-    "budget": <number or 400 if not specified>,
-    "delivery_days": <number or 5 if not specified>,
-    "size": "<size like M, L, XL or M if not specified>",
-    "preferences": {{
-        "warmth": "<high/medium/low or empty>",
-        "waterproof": <true/false>,
-        "brand": "<brand name or empty>",
-        "color": "<color or empty>"
-    }},
-    "items": [<list of items like "jacket", "pants", "gloves", "goggles", "helmet">],
-    "scenario": "<skiing/party/hackathon/custom>"
-}}
-
-Rules:
-- If request mentions skiing/snow: include jacket, pants, gloves, goggles, helmet
-- If request mentions party/game: include jacket, pants
-- If request mentions hackathon: include jacket, pants
-- Extract budget from phrases like "$400", "400 dollars", "budget 400"
-- Extract delivery from "5 days", "within 3 days", "in 2 days"
-- Extract size from "size M", "medium", "large"
-- Detect warmth need from "warm", "cold weather", "insulated"
-- Detect waterproof from "waterproof", "water resistant", "rain"
-
-Return ONLY the JSON object, nothing else."""
-
+        brief, truncated = truncate_brief(message, GEMINI_MAX_BRIEF_TOKENS)
+        response = None
+        start = time.perf_counter()
+        
         try:
-            response = gemini_model.generate_content(prompt)
+            with stage('gemini'):
+                response = gemini_model.generate_content(
+                    f'User request: "{brief}"',
+                    generation_config=GEMINI_GENERATION_CONFIG
+                )
             
-            # Clean response - remove markdown code blocks if present
-            response_text = response.text.strip()
-            if response_text.startswith('```'):
-                # Remove ```json and ``` markers
-                response_text = response_text.split('```')[1]
-                if response_text.startswith('json'):
-                    response_text = response_text[4:]
+            spec = json.loads(response.text)
+            if not isinstance(spec, dict):
+                raise ValueError(f"Expected a JSON object, got {type(spec).__name__}")
             
-            spec = json.loads(response_text.strip())
+            call = gemini_usage.record((time.perf_counter() - start) * 1000, response, truncated)
+            print(f"🤖 Gemini: {call['latency_ms']}ms, {call['prompt_tokens']} → {call['output_tokens']} tokens")
             
             # Validate and set defaults
             spec.setdefault('budget', 400)
@@ -136,6 +165,7 @@ Return ONLY the JSON object, nothing else."""
             return spec
             
         except Exception as e:
+            gemini_usage.record((time.perf_counter() - start) * 1000, response, truncated, failed=True)
             print(f"Gemini parsing error: {e}")
             # Fallback to regex parsing
             return self.parse_brief_with_regex(message)
@@ -256,11 +286,12 @@ Return ONLY the JSON object, nothing else."""
         
         return spec
     
-    def parse_brief(self, message):
+    def parse_brief(self, message, allow_ai=True):
         """
         Main parsing function - Uses AI if available, regex otherwise
+        allow_ai=False forces regex parsing (e.g. when under load)
         """
-        if self.use_ai:
+        if self.use_ai and allow_ai:
             print("🤖 Using Gemini AI for parsing...")
             spec = self.parse_brief_with_gemini(message)
         else:
@@ -291,7 +322,7 @@ Return ONLY the JSON object, nothing else."""
                 reasoning.append(f"Price: ${product['price']} (OVER BUDGET, 0pts)")
             
             # DELIVERY SCORING (30 points)
-            delivery_days = RETAILERS[product['retailer']]['base_delivery']
+            delivery_days = self.catalog.retailers[product['retailer']]['base_delivery']
             if delivery_days <= spec['delivery_days']:
                 time_ratio = delivery_days / spec['delivery_days']
                 delivery_score = 30 * (1 - time_ratio * 0.5)
@@ -323,7 +354,7 @@ Return ONLY the JSON object, nothing else."""
                     reasoning.append(f"Brand match (+10pts)")
             
             score += bonus_points
-            reasoning.append(f"Retailer: {RETAILERS[product['retailer']]['name']}")
+            reasoning.append(f"Retailer: {self.catalog.retailers[product['retailer']]['name']}")
             
             ranked_product = product.copy()
             ranked_product['score'] = round(score, 1)
@@ -339,8 +370,8 @@ Return ONLY the JSON object, nothing else."""
         all_products = {}
         
         for item_type in spec['items']:
-            if item_type in PRODUCT_DATABASE:
-                ranked = self.rank_products(PRODUCT_DATABASE[item_type], spec)
+            if item_type in self.catalog.products:
+                ranked = catalog_store.rank_cache.get_or_rank(self.catalog, item_type, spec, self.rank_products)
                 all_products[item_type] = ranked
         
         self.products = all_products
@@ -391,12 +422,12 @@ Return ONLY the JSON object, nothing else."""
         latest_delivery = 0
         
         for category, product in cart.items():
-            days = product.get('delivery_days', RETAILERS[product['retailer']]['base_delivery'])
+            days = product.get('delivery_days', self.catalog.retailers[product['retailer']]['base_delivery'])
             delivery_date = datetime.now() + timedelta(days=days)
             timelines[category] = {
                 'days': days,
                 'date': delivery_date.strftime('%B %d, %Y'),
-                'retailer': RETAILERS[product['retailer']]['name']
+                'retailer': self.catalog.retailers[product['retailer']]['name']
             }
             latest_delivery = max(latest_delivery, days)
         
@@ -409,7 +440,8 @@ Return ONLY the JSON object, nothing else."""
     
     def simulate_checkout(self, cart):
         """Simulate checkout flow"""
-        retailers = list(set(product['retailer'] for product in cart.values()))
+        # Cart order, not set order - keeps responses identical across processes
+        retailers = list(dict.fromkeys(product['retailer'] for product in cart.values()))
         
         steps = [
             {'id': 1, 'title': 'Collecting Payment Information', 'status': 'pending', 'retailer': 'all'},
@@ -419,7 +451,7 @@ Return ONLY the JSON object, nothing else."""
         for idx, retailer in enumerate(retailers):
             steps.append({
                 'id': idx + 3,
-                'title': f"Processing {RETAILERS[retailer]['name']} Order",
+                'title': f"Processing {self.catalog.retailers[retailer]['name']} Order",
                 'status': 'pending',
                 'retailer': retailer,
                 'items': [p['name'] for p in cart.values() if p['retailer'] == retailer]
@@ -439,6 +471,77 @@ Return ONLY the JSON object, nothing else."""
 agent = ShoppingAgent()
 
 
+def require_admin(view):
+    """Require 'Authorization: Bearer <ADMIN_TOKEN>' on admin routes"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Not found'}), 404
+        
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        return view(*args, **kwargs)
+    return wrapped
+
+
+@app.before_request
+def start_request_timer():
+    """Per-request timing for slow-request capture"""
+    g.request_start = time.perf_counter()
+    g.stage_timings = {}
+    if request.path.startswith('/api/'):
+        profiler.begin_request()
+
+
+@app.teardown_request
+def stop_profiling_request(error=None):
+    """Stop sampling this thread even if the request errored before after_request"""
+    profiler.discard_request()
+
+
+@app.after_request
+def record_request(response):
+    """Hand finished API requests to the profiler and traffic recorder"""
+    if not request.path.startswith('/api/') or 'request_start' not in g:
+        return response
+    
+    body = request.get_json(silent=True) if request.is_json else None
+    elapsed_ms = round((time.perf_counter() - g.request_start) * 1000, 2)
+    # Same server-side measurement the capture records, for replay.py
+    response.headers['Server-Timing'] = f"app;dur={elapsed_ms}"
+    
+    profiler.end_request({
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'elapsed_ms': elapsed_ms,
+        'stages': g.stage_timings,
+        'request': body,
+        'timestamp': datetime.now().isoformat()
+    })
+    
+    if traffic_recorder and request.path in CAPTURED_PATHS and traffic_recorder.should_sample():
+        traffic_recorder.record({
+            'ts': time.time(),
+            'method': request.method,
+            'path': request.path,
+            'client': traffic_recorder.client_key(admission.client_id()),
+            'body': body,
+            'status': response.status_code,
+            'elapsed_ms': elapsed_ms,
+            'stages': g.stage_timings,
+            'response_hash': response_hash(response.get_json(silent=True)),
+            'sample_rate': traffic_recorder.sample_rate,
+            # Lets replay skip responses it can't reproduce
+            'parsing_method': g.get('parsing_method'),
+            'admission': g.get('admission_outcome', 'admitted')
+        })
+    
+    return response
+
+
 @app.route('/')
 def index():
     """Main page"""
@@ -446,6 +549,7 @@ def index():
 
 
 @app.route('/api/parse-brief', methods=['POST'])
+@admission.limit('parse-brief')
 def parse_brief():
     """Parse shopping request - AI or Regex"""
     try:
@@ -455,8 +559,12 @@ def parse_brief():
         if not message:
             return jsonify({'error': 'No message provided'}), 400
         
-        spec = agent.parse_brief(message)
-        spec['parsing_method'] = 'gemini_ai' if agent.use_ai else 'regex'
+        # Degrade to regex-only parsing while the instance is under pressure
+        use_ai = agent.use_ai and not admission.under_pressure()
+        with stage('parse'):
+            spec = agent.parse_brief(message, allow_ai=use_ai)
+        g.parsing_method = 'gemini_ai' if use_ai else 'regex'
+        spec['parsing_method'] = g.parsing_method
         
         return jsonify(spec)
     
@@ -465,6 +573,7 @@ def parse_brief():
 
 
 @app.route('/api/discover-products', methods=['POST'])
+@admission.limit('discover-products')
 def discover_products():
     """Discover and rank products"""
     try:
@@ -474,12 +583,19 @@ def discover_products():
         if not spec:
             return jsonify({'error': 'No specification provided'}), 400
         
-        products = agent.discover_products(spec)
-        cart = agent.get_auto_selected_cart()
-        total = agent.calculate_total(cart)
-        budget_info = agent.get_budget_breakdown(cart, spec)
-        delivery_info = agent.get_delivery_timeline(cart)
-        retailer_info = agent.optimize_cart_for_retailers(cart)
+        # Per-request agent - the shared one is not safe across worker threads
+        request_agent = ShoppingAgent()
+        request_agent.spec = spec
+        with stage('rank'):
+            products = request_agent.discover_products(spec)
+        with stage('cart'):
+            cart = request_agent.get_auto_selected_cart()
+            total = request_agent.calculate_total(cart)
+            budget_info = request_agent.get_budget_breakdown(cart, spec)
+        with stage('delivery'):
+            delivery_info = request_agent.get_delivery_timeline(cart)
+        with stage('retailers'):
+            retailer_info = request_agent.optimize_cart_for_retailers(cart)
         
         return jsonify({
             'products': products,
@@ -495,6 +611,7 @@ def discover_products():
 
 
 @app.route('/api/checkout', methods=['POST'])
+@admission.limit('checkout')
 def checkout():
     """Checkout simulation"""
     try:
@@ -504,7 +621,8 @@ def checkout():
         if not cart:
             return jsonify({'error': 'Empty cart'}), 400
         
-        steps = agent.simulate_checkout(cart)
+        with stage('checkout'):
+            steps = ShoppingAgent().simulate_checkout(cart)
         return jsonify({'steps': steps})
     
     except Exception as e:
@@ -514,19 +632,94 @@ def checkout():
 @app.route('/api/retailers')
 def get_retailers():
     """Retailer info"""
-    return jsonify(RETAILERS)
+    return jsonify(catalog_store.current.retailers)
 
 
 @app.route('/api/health')
 def health_check():
-    """Health check"""
+    """Health check - 503 while saturated so the load balancer routes around us"""
+    saturated = admission.saturated()
+    load = admission.snapshot()
+    use_ai = agent.use_ai and not load['under_pressure']
+    
+    if saturated:
+        status = 'saturated'
+    elif load['under_pressure']:
+        status = 'degraded'
+    else:
+        status = 'healthy'
+    
     return jsonify({
-        'status': 'healthy',
-        'ai_parsing': agent.use_ai,
-        'parsing_method': 'gemini_ai' if agent.use_ai else 'regex',
-        'model': 'gemini-2.0-flash-lite' if agent.use_ai else 'N/A',
+        'status': status,
+        'ai_parsing': use_ai,
+        'parsing_method': 'gemini_ai' if use_ai else 'regex',
+        'model': 'gemini-2.0-flash-lite' if use_ai else 'N/A',
+        'load': load,
+        'catalog_version': catalog_store.current.version,
+        'feed': feed_ingestor.status() if feed_ingestor else None,
+        'gemini': gemini_usage.snapshot() if agent.use_ai else None,
         'message': 'Agentic Commerce running!'
-    })
+    }), 503 if saturated else 200
+
+
+@app.route('/api/admin/profiler', methods=['GET'])
+@require_admin
+def profiler_status():
+    """Profiler state for this worker"""
+    return jsonify(profiler.status())
+
+
+@app.route('/api/admin/profiler', methods=['POST'])
+@require_admin
+def profiler_start():
+    """
+    Arm the sampling profiler
+    {"seconds": 30} samples every thread for 30s
+    {"seconds": 300, "threshold_ms": 500} keeps requests slower than 500ms
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        seconds = float(data.get('seconds', 30))
+        threshold_ms = data.get('threshold_ms')
+        interval_ms = float(data.get('interval_ms', 10))
+        
+        if seconds <= 0:
+            return jsonify({'error': 'seconds must be positive'}), 400
+        
+        profiler.start(seconds, None if threshold_ms is None else float(threshold_ms), interval_ms)
+        return jsonify(profiler.status())
+    
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+
+
+@app.route('/api/admin/profiler', methods=['DELETE'])
+@require_admin
+def profiler_stop():
+    """Disarm the profiler early"""
+    profiler.stop()
+    return jsonify(profiler.status())
+
+
+@app.route('/api/admin/profiler/captures', methods=['GET', 'DELETE'])
+@require_admin
+def profiler_captures():
+    """Download the capture ring buffer - ?format=collapsed for flamegraph.pl"""
+    if request.method == 'DELETE':
+        profiler.clear()
+        return jsonify(profiler.status())
+    
+    if request.args.get('format') == 'collapsed':
+        return app.response_class(
+            profiler.collapsed(),
+            mimetype='text/plain',
+            headers={'Content-Disposition': 'attachment; filename=profile.collapsed'}
+        )
+    
+    return jsonify({'captures': profiler.snapshot()})
 
 
 if __name__ == '__main__':
@@ -552,13 +745,8 @@ if __name__ == '__main__':
     else:
         print("📝 Regex Parsing: ENABLED (No API needed)")
     
+    # The debug reloader parent only watches files - its child serves requests
+    if not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_feed_ingestor()
+    
     app.run(debug=debug_mode, host='0.0.0.0', port=port)
-```
-
----
-
-### 3. **Create 2 new files** in your project folder
-
-**File 1: `Procfile`** (no extension, exactly this name)
-```
-web: gunicorn app:app
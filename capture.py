@@ -0,0 +1,108 @@
+"""
+Sampled traffic capture to rotating JSONL files
+Each line is one request that replay.py can drive against a local instance
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import random
+import threading
+
+
+# Response fields that change from run to run (delivery dates depend on today)
+VOLATILE_KEYS = {'date', 'latest_delivery_date'}
+
+
+def _strip_volatile(value):
+    if isinstance(value, dict):
+        return {k: _strip_volatile(v) for k, v in value.items() if k not in VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_strip_volatile(v) for v in value]
+    return value
+
+
+def response_hash(payload):
+    """Stable hash of a JSON response, ignoring volatile fields"""
+    canonical = json.dumps(_strip_volatile(payload), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def client_hash(client_id, key):
+    """
+    Pseudonymous client key - keeps per-client load shape without storing IPs
+    Keyed, since a plain hash of an IPv4 address is brute-forced in minutes
+    """
+    return hmac.new(key, client_id.encode(), hashlib.sha256).hexdigest()[:12]
+
+
+class TrafficRecorder:
+    """Appends sampled requests to a JSONL file, rotating at max_bytes"""
+
+    def __init__(self, path, sample_rate=0.1, max_bytes=50 * 1024 * 1024, backups=5, salt=None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backups = backups
+        # Without a configured salt, client keys only group within this process
+        self.salt = salt.encode() if salt else os.urandom(32)
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Build a recorder from TRAFFIC_CAPTURE_* variables - None if disabled"""
+        if os.getenv('TRAFFIC_CAPTURE', 'false').lower() != 'true':
+            return None
+        return cls(
+            path=os.getenv('TRAFFIC_CAPTURE_PATH', 'captures/traffic.jsonl'),
+            sample_rate=float(os.getenv('TRAFFIC_SAMPLE_RATE', 0.1)),
+            max_bytes=int(float(os.getenv('TRAFFIC_CAPTURE_MAX_MB', 50)) * 1024 * 1024),
+            backups=int(os.getenv('TRAFFIC_CAPTURE_BACKUPS', 5)),
+            salt=os.getenv('TRAFFIC_CAPTURE_SALT')
+        )
+
+    def client_key(self, client_id):
+        return client_hash(client_id, self.salt)
+
+    def should_sample(self):
+        return random.random() < self.sample_rate
+
+    def record(self, entry):
+        """Append one entry - capture must never fail the request it describes"""
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        try:
+            with self.lock:
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    self._rotate()
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+        except OSError as e:
+            print(f"Traffic capture error: {e}")
+
+    def _rotate(self):
+        """traffic.jsonl -> traffic.jsonl.1 -> ... -> traffic.jsonl.<backups>"""
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+def load_entries(paths):
+    """Read capture files (rotated backups included) ordered by timestamp"""
+    entries = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entries.append(json.loads(line))
+    entries.sort(key=lambda e: e['ts'])
+    return entries
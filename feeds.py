@@ -0,0 +1,330 @@
+"""
+Live price, stock and delivery feed ingestion
+Updates are applied as copy-on-write catalog versions swapped in atomically
+"""
+
+import json
+import math
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+
+PRODUCT_FIELDS = {'price', 'rating', 'in_stock'}
+RETAILER_FIELDS = {'base_delivery'}
+
+# Accepted ranges - values outside break JSON responses or date arithmetic
+MAX_PRICE = 100000
+MAX_RATING = 5
+MAX_DELIVERY_DAYS = 365
+
+
+class Catalog:
+    """Immutable catalog snapshot - never mutated once published"""
+
+    def __init__(self, version, retailers, products, category_versions, index=None, retailer_categories=None):
+        self.version = version
+        self.retailers = retailers
+        self.products = products
+        self.category_versions = category_versions
+        # id -> (category, position), retailer -> categories it sells in
+        # Built once for the seed catalog, then shared by later versions
+        if index is None:
+            index, retailer_categories = self._build_index(products)
+        self.index = index
+        self.retailer_categories = retailer_categories
+
+    @staticmethod
+    def _build_index(products):
+        index = {}
+        retailer_categories = {}
+        for category, items in products.items():
+            for position, product in enumerate(items):
+                index[product['id']] = (category, position)
+                retailer_categories.setdefault(product['retailer'], set()).add(category)
+        return index, retailer_categories
+
+    def in_stock(self, category):
+        return [p for p in self.products.get(category, []) if p.get('in_stock', True)]
+
+
+class RankCache:
+    """LRU of ranked category lists keyed by category version and spec"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_rank(self, catalog, category, spec, rank):
+        """Cached rank(products, spec) for this category version"""
+        key = (category, catalog.category_versions[category], self._spec_key(spec))
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        ranked = rank(catalog.in_stock(category), spec)
+
+        with self.lock:
+            self.entries[key] = ranked
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return ranked
+
+    def invalidate(self, categories):
+        """Drop entries for categories that just got a new version"""
+        with self.lock:
+            for key in [k for k in self.entries if k[0] in categories]:
+                del self.entries[key]
+
+    def _spec_key(self, spec):
+        return json.dumps(
+            [spec['budget'], spec['delivery_days'], spec.get('preferences', {})],
+            sort_keys=True
+        )
+
+
+class CatalogStore:
+    """Holds the current catalog - readers never take a lock"""
+
+    def __init__(self, retailers, products):
+        self.current = Catalog(
+            version=1,
+            retailers={key: dict(r) for key, r in retailers.items()},
+            products={category: [dict(p) for p in items] for category, items in products.items()},
+            category_versions={category: 1 for category in products}
+        )
+        self.rank_cache = RankCache()
+        self.write_lock = threading.Lock()
+
+    def apply(self, updates):
+        """
+        Apply a batch of updates as one new catalog version
+        Only touched lists and products are copied, the rest is shared
+        Returns (applied, skipped)
+        """
+        with self.write_lock:
+            base = self.current
+            retailers = base.retailers
+            products = dict(base.products)
+            copied = set()
+            touched = set()
+            applied = skipped = 0
+
+            for update in updates:
+                try:
+                    if not isinstance(update, dict):
+                        raise ValueError(f"update must be an object, got {update!r}")
+                    if 'retailer' in update:
+                        key = update['retailer']
+                        fields = self._validate(update, RETAILER_FIELDS, base.retailers, key)
+                        if retailers is base.retailers:
+                            retailers = dict(base.retailers)
+                        retailers[key] = dict(retailers[key], **fields)
+                        touched |= base.retailer_categories.get(key, set())
+                    else:
+                        product_id = update.get('id')
+                        fields = self._validate(update, PRODUCT_FIELDS, base.index, product_id)
+                        category, position = base.index[product_id]
+                        if category not in copied:
+                            products[category] = list(products[category])
+                            copied.add(category)
+                        products[category][position] = dict(products[category][position], **fields)
+                        touched.add(category)
+                    applied += 1
+                except (ValueError, TypeError, OverflowError) as e:
+                    print(f"Feed update skipped: {e}")
+                    skipped += 1
+
+            if not applied:
+                return applied, skipped
+
+            category_versions = dict(base.category_versions)
+            for category in touched:
+                category_versions[category] += 1
+
+            # Updates never add, move or re-home products, so the indexes carry over.
+            # Single reference assignment - in-flight requests keep their snapshot
+            self.current = Catalog(
+                base.version + 1, retailers, products, category_versions,
+                index=base.index, retailer_categories=base.retailer_categories
+            )
+            self.rank_cache.invalidate(touched)
+            return applied, skipped
+
+    def _validate(self, update, allowed, known, key):
+        if not isinstance(key, str) or key not in known:
+            raise ValueError(f"unknown key {key!r}")
+
+        fields = {f: update[f] for f in allowed if f in update}
+        if not fields:
+            raise ValueError(f"no updatable fields for {key!r}")
+
+        for field, value in fields.items():
+            if field == 'in_stock':
+                if not isinstance(value, bool):
+                    raise ValueError(f"{field} must be true/false")
+                continue
+
+            # Ints are always finite, and math.isfinite overflows on huge ones
+            if (isinstance(value, bool) or not isinstance(value, (int, float))
+                    or isinstance(value, float) and not math.isfinite(value)):
+                raise ValueError(f"{field} must be a finite number")
+            if field == 'price' and not 0 < value <= MAX_PRICE:
+                raise ValueError(f"price must be above 0 and at most {MAX_PRICE}")
+            if field == 'rating' and not 0 <= value <= MAX_RATING:
+                raise ValueError(f"rating must be between 0 and {MAX_RATING}")
+            if field == 'base_delivery' and (not isinstance(value, int) or not 0 <= value <= MAX_DELIVERY_DAYS):
+                raise ValueError(f"base_delivery must be a whole number of days from 0 to {MAX_DELIVERY_DAYS}")
+        return fields
+
+
+class FileTailSource:
+    """Follows a JSONL file like tail -f, reopening it after truncation"""
+
+    def __init__(self, path, poll_interval=0.5):
+        self.path = path
+        self.poll_interval = poll_interval
+
+    def __str__(self):
+        return f"file {self.path}"
+
+    def lines(self, stop_event):
+        """Yields lines, or None on every idle poll"""
+        position = 0
+        while not stop_event.is_set():
+            try:
+                if os.path.getsize(self.path) < position:
+                    position = 0
+                with open(self.path, encoding='utf-8', errors='replace') as f:
+                    f.seek(position)
+                    while True:
+                        line = f.readline()
+                        if not line.endswith('\n'):
+                            break
+                        position = f.tell()
+                        yield line
+            except FileNotFoundError:
+                pass
+            yield None
+            stop_event.wait(self.poll_interval)
+
+
+class SocketSource:
+    """Line-delimited JSON over TCP - stands in for a real feed connection"""
+
+    def __init__(self, host, port, poll_interval=0.5):
+        self.host = host
+        self.port = port
+        self.poll_interval = poll_interval
+
+    def __str__(self):
+        return f"socket {self.host}:{self.port}"
+
+    def lines(self, stop_event):
+        """Yields lines from one publisher at a time, or None when idle"""
+        with socket.create_server((self.host, self.port)) as server:
+            server.settimeout(self.poll_interval)
+            while not stop_event.is_set():
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    yield None
+                    continue
+
+                with conn:
+                    conn.settimeout(self.poll_interval)
+                    buffer = b''
+                    while not stop_event.is_set():
+                        try:
+                            chunk = conn.recv(65536)
+                        except socket.timeout:
+                            yield None
+                            continue
+                        if not chunk:
+                            break
+                        buffer += chunk
+                        *complete, buffer = buffer.split(b'\n')
+                        for line in complete:
+                            yield line.decode('utf-8', errors='replace')
+
+
+class FeedIngestor:
+    """Background thread batching feed lines into catalog versions"""
+
+    def __init__(self, store, source, batch_size=100, batch_interval=0.2):
+        self.store = store
+        self.source = source
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.applied = 0
+        self.skipped = 0
+        self.last_applied_at = None
+        self.error = None
+
+    @classmethod
+    def from_env(cls, store):
+        """Build from FEED_FILE or FEED_SOCKET (host:port) - None if neither is set"""
+        if os.getenv('FEED_FILE'):
+            source = FileTailSource(os.getenv('FEED_FILE'))
+        elif os.getenv('FEED_SOCKET'):
+            host, _, port = os.getenv('FEED_SOCKET').rpartition(':')
+            source = SocketSource(host or '127.0.0.1', int(port))
+        else:
+            return None
+        return cls(store, source, batch_size=int(os.getenv('FEED_BATCH_SIZE', 100)))
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='feed-ingestor', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.batch_interval
+        try:
+            for line in self.source.lines(self.stop_event):
+                if line is not None and line.strip():
+                    try:
+                        batch.append(json.loads(line))
+                    except ValueError:
+                        # Bad JSON, or an int too long to convert
+                        self.skipped += 1
+                if batch and (len(batch) >= self.batch_size or line is None or time.monotonic() >= deadline):
+                    # Cleared first so a failing batch isn't flushed again below
+                    pending, batch = batch, []
+                    self._flush(pending)
+                if not batch:
+                    deadline = time.monotonic() + self.batch_interval
+        except Exception as e:
+            # Surfaced through status() in /api/health
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Feed ingestion stopped ({self.source}): {self.error}")
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        applied, skipped = self.store.apply(batch)
+        self.applied += applied
+        self.skipped += skipped
+        if applied:
+            self.last_applied_at = time.time()
+
+    def status(self):
+        return {
+            'source': str(self.source),
+            'running': self.thread is not None and self.thread.is_alive(),
+            'applied': self.applied,
+            'skipped': self.skipped,
+            'last_applied_at': self.last_applied_at,
+            'error': self.error
+        }
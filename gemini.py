@@ -0,0 +1,125 @@
+"""
+Gemini request setup for brief parsing
+Static rules go in the system instruction, output is constrained to a JSON schema
+"""
+
+import threading
+
+
+SYSTEM_INSTRUCTION = """You are a shopping assistant. Parse the user's shopping request into the JSON schema you are given.
+
+Defaults when not specified: budget 400, delivery_days 5, size "M", scenario "custom".
+
+Rules:
+- If request mentions skiing/snow: include jacket, pants, gloves, goggles, helmet
+- If request mentions party/game: include jacket, pants
+- If request mentions hackathon: include jacket, pants
+- Extract budget from phrases like "$400", "400 dollars", "budget 400"
+- Extract delivery from "5 days", "within 3 days", "in 2 days"
+- Extract size from "size M", "medium", "large"
+- Detect warmth need from "warm", "cold weather", "insulated"
+- Detect waterproof from "waterproof", "water resistant", "rain"
+- Leave brand and color out unless the request names them"""
+
+# Rough size of a token for budgeting without a count_tokens round trip
+CHARS_PER_TOKEN = 4
+
+
+def spec_schema(item_types):
+    """Response schema for a parsed shopping spec"""
+    return {
+        'type': 'object',
+        'properties': {
+            'budget': {'type': 'number'},
+            'delivery_days': {'type': 'integer'},
+            'size': {'type': 'string'},
+            'preferences': {
+                'type': 'object',
+                'properties': {
+                    'warmth': {'type': 'string', 'enum': ['high', 'medium', 'low']},
+                    'waterproof': {'type': 'boolean'},
+                    'brand': {'type': 'string'},
+                    'color': {'type': 'string'}
+                }
+            },
+            'items': {'type': 'array', 'items': {'type': 'string', 'enum': list(item_types)}},
+            'scenario': {'type': 'string', 'enum': ['skiing', 'party', 'hackathon', 'custom']}
+        },
+        'required': ['budget', 'delivery_days', 'size', 'preferences', 'items', 'scenario']
+    }
+
+
+def generation_config(item_types, max_output_tokens):
+    """Schema-constrained JSON output with a capped response size"""
+    return {
+        'response_mime_type': 'application/json',
+        'response_schema': spec_schema(item_types),
+        'max_output_tokens': max_output_tokens,
+        'temperature': 0
+    }
+
+
+def truncate_brief(message, max_tokens):
+    """
+    Fit a brief into max_tokens (estimated) - keeps the start and the end,
+    where budgets and deadlines usually are. Returns (text, truncated)
+    """
+    if max_tokens <= 0:
+        raise ValueError(f"max_tokens must be positive, got {max_tokens}")
+
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(message) <= max_chars:
+        return message, False
+
+    separator = ' ... '
+    keep = max_chars - len(separator)
+    tail = keep // 4
+    if tail <= 0:
+        return message[:max_chars], True
+    return f"{message[:keep - tail]}{separator}{message[-tail:]}", True
+
+
+class GeminiUsage:
+    """Running token and latency totals for Gemini calls"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.truncated = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.total_latency_ms = 0.0
+        self.last_call = None
+
+    def record(self, latency_ms, response=None, truncated=False, failed=False):
+        """Add one call - token counts come from the response's usage metadata"""
+        usage = getattr(response, 'usage_metadata', None)
+        call = {
+            'latency_ms': round(latency_ms, 1),
+            'prompt_tokens': getattr(usage, 'prompt_token_count', 0) or 0,
+            'output_tokens': getattr(usage, 'candidates_token_count', 0) or 0,
+            'truncated': truncated,
+            'failed': failed
+        }
+        with self.lock:
+            self.calls += 1
+            self.failures += failed
+            self.truncated += truncated
+            self.prompt_tokens += call['prompt_tokens']
+            self.output_tokens += call['output_tokens']
+            self.total_latency_ms += latency_ms
+            self.last_call = call
+        return call
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'failures': self.failures,
+                'truncated': self.truncated,
+                'prompt_tokens': self.prompt_tokens,
+                'output_tokens': self.output_tokens,
+                'avg_latency_ms': round(self.total_latency_ms / self.calls, 1) if self.calls else 0,
+                'last_call': self.last_call
+            }
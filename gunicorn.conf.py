@@ -0,0 +1,19 @@
+"""
+Gunicorn settings - loaded automatically from the working directory
+WORKER_THREADS is also what admission.py sizes its limits from
+"""
+
+import os
+
+
+worker_class = 'gthread'
+threads = int(os.getenv('WORKER_THREADS', 32))
+
+
+def post_fork(server, worker):
+    """Start the live catalog feed in the worker, never in the master"""
+    if os.getenv('FEED_SOCKET') and server.num_workers > 1:
+        server.log.warning("FEED_SOCKET binds one port per host - only one of %s workers will get updates",
+                           server.num_workers)
+    from app import start_feed_ingestor
+    start_feed_ingestor()
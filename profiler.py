@@ -0,0 +1,166 @@
+"""
+On-demand sampling profiler and slow-request capture
+Samples thread stacks in collapsed (flamegraph) format into a ring buffer
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+
+MAX_SECONDS = 300
+
+
+@contextmanager
+def stage(name):
+    """Record how long a block takes as a named stage of the current request"""
+    if not has_request_context():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = g.setdefault('stage_timings', {})
+        timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+
+class SamplingProfiler:
+    """
+    Two modes, both armed for a fixed number of seconds:
+    - window: aggregate stacks of every thread into one capture
+    - slow requests: sample request threads, keep those over threshold_ms
+    """
+
+    def __init__(self, buffer_size=50, max_depth=64):
+        self.captures = deque(maxlen=buffer_size)
+        self.max_depth = max_depth
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.requests = {}
+        self.window = None
+        self.threshold_ms = None
+        self.interval = 0.01
+        self.started_at = None
+        self.active_until = 0
+
+    def is_active(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds, threshold_ms=None, interval_ms=10):
+        """Arm the profiler - raises RuntimeError if already running"""
+        with self.lock:
+            if self.is_active():
+                raise RuntimeError('Profiler already running')
+
+            self.interval = max(interval_ms, 1) / 1000
+            self.threshold_ms = threshold_ms
+            self.window = Counter() if threshold_ms is None else None
+            self.requests = {}
+            self.started_at = time.time()
+            self.active_until = time.monotonic() + min(seconds, MAX_SECONDS)
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Disarm early - the partial window capture is still kept"""
+        self.stop_event.set()
+        if self.is_active():
+            self.thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        samples = 0
+
+        while not self.stop_event.wait(self.interval) and time.monotonic() < self.active_until:
+            frames = sys._current_frames()
+            with self.lock:
+                if self.window is not None:
+                    for thread_id, frame in frames.items():
+                        if thread_id != own_id:
+                            self.window[self._collapse(frame)] += 1
+                else:
+                    for thread_id, stacks in self.requests.items():
+                        frame = frames.get(thread_id)
+                        if frame is not None:
+                            stacks[self._collapse(frame)] += 1
+            samples += 1
+
+        with self.lock:
+            if self.window is not None:
+                self.captures.append({
+                    'kind': 'window',
+                    'pid': os.getpid(),
+                    'started_at': self.started_at,
+                    'duration_s': round(time.time() - self.started_at, 2),
+                    'samples': samples,
+                    'stacks': dict(self.window)
+                })
+            self.window = None
+            self.requests = {}
+
+    def _collapse(self, frame):
+        """Root-first 'file:function;...' stack as used by flamegraph.pl"""
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def begin_request(self):
+        """Start sampling the current thread if slow-request mode is armed"""
+        if self.threshold_ms is None or not self.is_active():
+            return
+        with self.lock:
+            self.requests[threading.get_ident()] = Counter()
+
+    def end_request(self, info):
+        """Keep the request's stacks if it took longer than the threshold"""
+        with self.lock:
+            stacks = self.requests.pop(threading.get_ident(), None)
+            if stacks is None or self.threshold_ms is None or info['elapsed_ms'] < self.threshold_ms:
+                return
+            capture = dict(info, kind='slow_request', pid=os.getpid(), stacks=dict(stacks))
+            self.captures.append(capture)
+
+    def discard_request(self):
+        """Stop sampling the current thread without keeping a capture"""
+        with self.lock:
+            self.requests.pop(threading.get_ident(), None)
+
+    def status(self):
+        """Current mode and buffer usage"""
+        return {
+            'active': self.is_active(),
+            'mode': None if not self.is_active() else ('window' if self.threshold_ms is None else 'slow_requests'),
+            'threshold_ms': self.threshold_ms if self.is_active() else None,
+            'interval_ms': round(self.interval * 1000),
+            'remaining_s': round(max(self.active_until - time.monotonic(), 0), 1) if self.is_active() else 0,
+            'captures': len(self.captures),
+            'buffer_size': self.captures.maxlen,
+            'pid': os.getpid()
+        }
+
+    def snapshot(self):
+        """Copy of the ring buffer contents"""
+        with self.lock:
+            return list(self.captures)
+
+    def collapsed(self):
+        """All buffered stacks merged into flamegraph collapsed text"""
+        merged = Counter()
+        for capture in self.snapshot():
+            merged.update(capture['stacks'])
+        return ''.join(f"{stack} {count}\n" for stack, count in merged.most_common())
+
+    def clear(self):
+        with self.lock:
+            self.captures.clear()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Replay captured traffic against a local instance
+Reproduces production load shapes with a stubbed Gemini model
+
+Usage:
+    python replay.py captures/traffic.jsonl captures/traffic.jsonl.1
+    python replay.py captures/traffic.jsonl --speed 4
+    python replay.py captures/traffic.jsonl --target http://localhost:5000
+"""
+
+import argparse
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import requests
+
+from capture import load_entries, response_hash
+
+
+class StubGeminiModel:
+    """Stands in for gemini_model - regex parse after a fixed latency"""
+
+    def __init__(self, latency_ms, parser):
+        self.latency = latency_ms / 1000
+        self.parser = parser
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(self.latency)
+        match = re.search(r'User request: "(.*)"', prompt, re.DOTALL)
+        message = match.group(1) if match else prompt
+        return SimpleNamespace(text=json.dumps(self.parser(message)))
+
+
+def start_local_server(gemini_latency_ms, use_gemini=True, admission=False):
+    """
+    Serve app.py in-process on a free port with Gemini stubbed out
+    Admission control is off unless asked for, so every parse takes the
+    stubbed Gemini path and replay bursts aren't shed by the replay itself
+    """
+    from werkzeug.serving import make_server
+    import app as shop_app
+
+    if use_gemini:
+        shop_app.gemini_model = StubGeminiModel(gemini_latency_ms, shop_app.ShoppingAgent().parse_brief_with_regex)
+    shop_app.agent.use_ai = use_gemini
+    shop_app.admission.enabled = admission
+    # Don't capture the replay itself
+    shop_app.traffic_recorder = None
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, shop_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def server_time_ms(response):
+    """Server-side time from the Server-Timing header set by app.py"""
+    match = re.search(r'\bapp;dur=([\d.]+)', response.headers.get('Server-Timing', ''))
+    return float(match.group(1)) if match else None
+
+
+def percentile(values, pct):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def sample_rate(entries):
+    """Mean capture sample rate - older captures without the field count as 1"""
+    return sum(e.get('sample_rate', 1.0) for e in entries) / len(entries)
+
+
+def replay_speed(entries, speed, captured_rate=False):
+    """
+    Offset divisor for replay - a 10% sample replayed 10x faster has the
+    request rate production had, unless the sampled rate is asked for
+    """
+    return speed if captured_rate else speed / sample_rate(entries)
+
+
+def replay(entries, base_url, speed, concurrency, timeout):
+    """Send entries at their recorded offsets divided by speed"""
+    sessions = threading.local()
+    results = []
+
+    def send(entry, due):
+        if not hasattr(sessions, 'session'):
+            sessions.session = requests.Session()
+        lag_ms = (time.monotonic() - due) * 1000
+        start = time.perf_counter()
+        server_ms = None
+        # Still sent for the load shape, but a rejection has no response to compare
+        rejected = entry.get('admission', 'admitted') != 'admitted'
+        try:
+            response = sessions.session.request(
+                entry['method'], base_url + entry['path'],
+                json=entry['body'],
+                headers={'X-Forwarded-For': entry['client']},
+                timeout=timeout
+            )
+            status = response.status_code
+            server_ms = server_time_ms(response)
+            try:
+                payload = response.json()
+            except ValueError:
+                payload = None
+            replayed_method = payload.get('parsing_method') if isinstance(payload, dict) else None
+
+            if rejected:
+                compared, matched = 'none', None
+            elif 'gemini_ai' in (entry.get('parsing_method'), replayed_method):
+                # Model output (or the stub's) can't be reproduced - status only
+                compared, matched = 'status', status == entry['status']
+            else:
+                compared = 'response'
+                matched = status == entry['status'] and response_hash(payload) == entry['response_hash']
+        except requests.RequestException:
+            status, compared, matched = 'error', 'none', False
+        results.append({
+            'path': entry['path'],
+            'status': status,
+            'recorded_status': entry['status'],
+            'round_trip_ms': (time.perf_counter() - start) * 1000,
+            'server_ms': server_ms,
+            'recorded_ms': entry['elapsed_ms'],
+            'lag_ms': lag_ms,
+            'rejected': rejected,
+            'compared': compared,
+            'matched': matched
+        })
+
+    t0 = entries[0]['ts']
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for entry in entries:
+            due = start + (entry['ts'] - t0) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, entry, due)
+
+    return results, time.monotonic() - start
+
+
+def summarize(results, max_p95_ratio, min_regression_ms=5):
+    """
+    Print per-endpoint results - returns False on a latency regression
+    Regressions compare server-side time on both sides; round trip is informational
+    Requests shed or rate limited in the capture are left out of latency and matching
+    """
+    ok = True
+    for path in sorted(set(r['path'] for r in results)):
+        rows = [r for r in results if r['path'] == path]
+        served = [r for r in rows if not r['rejected']]
+        server = [r['server_ms'] for r in served if r['server_ms'] is not None]
+        recorded = [r['recorded_ms'] for r in served]
+        round_trip = [r['round_trip_ms'] for r in served]
+        statuses = Counter(str(r['status']) for r in rows)
+        mismatches = sum(1 for r in rows if r['matched'] is False)
+        status_only = sum(1 for r in rows if r['compared'] == 'status')
+        p95, recorded_p95 = percentile(server, 95), percentile(recorded, 95)
+
+        print(f"\n📍 {path} ({len(rows)} requests)")
+        print(f"   Status:     {dict(statuses)}")
+        if server:
+            print(f"   Server:     p50 {percentile(server, 50):.1f}ms | p95 {p95:.1f}ms | p99 {percentile(server, 99):.1f}ms")
+        else:
+            print("   Server:     no Server-Timing header from target")
+        print(f"   Recorded:   p50 {percentile(recorded, 50):.1f}ms | p95 {recorded_p95:.1f}ms")
+        print(f"   Round trip: p50 {percentile(round_trip, 50):.1f}ms | p95 {percentile(round_trip, 95):.1f}ms")
+        print(f"   Send lag:   p95 {percentile([r['lag_ms'] for r in rows], 95):.1f}ms")
+        print(f"   Mismatches: {mismatches}")
+        if status_only:
+            print(f"   Gemini-parsed: {status_only} (status compared only)")
+        if len(served) < len(rows):
+            print(f"   Rejected in capture: {len(rows) - len(served)} (not compared)")
+
+        if max_p95_ratio and not server:
+            print("   ❌ Can't check p95 without server-side timings")
+            ok = False
+        elif (max_p95_ratio and p95 > recorded_p95 * max_p95_ratio
+              and p95 - recorded_p95 > min_regression_ms):
+            print(f"   ❌ Server p95 regressed more than {max_p95_ratio}x")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured traffic')
+    parser.add_argument('files', nargs='+', help='Capture JSONL files (rotated backups included)')
+    parser.add_argument('--target', help='Base URL of a running instance (default: in-process server)')
+    parser.add_argument('--speed', type=float, default=1.0, help='Rate multiplier - 2 replays twice as fast')
+    parser.add_argument('--captured-rate', action='store_true',
+                        help='Replay at the sampled rate instead of rebuilding the production rate')
+    parser.add_argument('--admission', action='store_true', help='Keep admission control on in the in-process server')
+    parser.add_argument('--concurrency', type=int, default=32, help='Max requests in flight')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--limit', type=int, help='Only replay the first N requests')
+    parser.add_argument('--gemini-latency-ms', type=float, default=300, help='Stubbed Gemini latency')
+    parser.add_argument('--no-gemini', action='store_true', help='Regex parsing only (captures made without Gemini)')
+    parser.add_argument('--max-p95-ratio', type=float, help='Fail if server-side p95 exceeds the recorded p95 by this factor')
+    parser.add_argument('--min-regression-ms', type=float, default=5, help='Ignore p95 increases smaller than this')
+    parser.add_argument('--fail-on-mismatch', action='store_true', help='Fail if any response differs')
+    args = parser.parse_args()
+
+    entries = load_entries(args.files)[:args.limit]
+    if not entries:
+        print("❌ No captured requests found")
+        return 1
+
+    if args.target:
+        base_url = args.target.rstrip('/')
+    else:
+        _, base_url = start_local_server(args.gemini_latency_ms, use_gemini=not args.no_gemini, admission=args.admission)
+
+    rate = sample_rate(entries)
+    speed = replay_speed(entries, args.speed, args.captured_rate)
+
+    print(f"🔁 Replaying {len(entries)} requests against {base_url} at {args.speed}x "
+          f"{'captured' if args.captured_rate else 'production'} rate (sample rate {rate:g})")
+    results, elapsed = replay(entries, base_url, speed, args.concurrency, args.timeout)
+    print(f"⏱️  Finished in {elapsed:.1f}s ({len(results) / max(elapsed, 1e-9):.1f} req/s)")
+
+    ok = summarize(results, args.max_p95_ratio, args.min_regression_ms)
+    if args.fail_on_mismatch and any(r['matched'] is False for r in results):
+        print("\n❌ Responses differ from the capture")
+        ok = False
+
+    print("\n✅ Replay passed" if ok else "\n❌ Replay failed")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
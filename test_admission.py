@@ -0,0 +1,141 @@
+"""
+Tests for admission control - run with: python -m pytest test_admission.py
+"""
+
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from admission import AdmissionController, EndpointLimiter, TokenBucket
+
+
+def make_app(controller):
+    app = Flask(__name__)
+
+    @app.route('/work', methods=['POST'])
+    @controller.limit('work')
+    def work():
+        return {'ok': True}
+
+    return app
+
+
+def test_token_bucket_allows_burst_then_limits():
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.allow('a')[0] for _ in range(3)] == [True, True, True]
+
+    allowed, retry_after = bucket.allow('a')
+    assert not allowed
+    assert 0 < retry_after <= 0.5
+    # Other clients have their own bucket
+    assert bucket.allow('b')[0]
+
+
+def test_token_bucket_is_capped():
+    bucket = TokenBucket(rate=1, burst=1, max_clients=5)
+    for i in range(50):
+        bucket.allow(str(i))
+    assert len(bucket.buckets) == 5
+    assert list(bucket.buckets) == ['45', '46', '47', '48', '49']
+
+
+def test_limiter_sheds_when_queue_full():
+    limiter = EndpointLimiter('x', max_concurrent=1, max_queue=0)
+    assert limiter.acquire(time.monotonic() + 1)
+    assert not limiter.acquire(time.monotonic() + 1)
+    assert limiter.shed == 1
+
+
+def test_limiter_sheds_fast_when_wait_exceeds_deadline():
+    limiter = EndpointLimiter('x', max_concurrent=1, max_queue=5)
+    limiter.avg_service_time = 2.0
+    assert limiter.acquire(time.monotonic() + 1)
+
+    start = time.monotonic()
+    assert not limiter.acquire(time.monotonic() + 1)
+    assert time.monotonic() - start < 0.1
+    assert limiter.retry_after() == 2
+
+
+def test_limiter_sheds_queued_request_at_deadline():
+    limiter = EndpointLimiter('x', max_concurrent=1, max_queue=5)
+    assert limiter.acquire(time.monotonic() + 1)
+
+    start = time.monotonic()
+    assert not limiter.acquire(time.monotonic() + 0.2)
+    waited = time.monotonic() - start
+    assert 0.15 <= waited < 1
+    assert limiter.queued == 0
+    assert limiter.shed == 1
+
+
+def test_limiter_hands_slot_to_queued_request():
+    limiter = EndpointLimiter('x', max_concurrent=1, max_queue=5)
+    assert limiter.acquire(time.monotonic() + 1)
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(limiter.acquire(time.monotonic() + 2)))
+    waiter.start()
+    time.sleep(0.1)
+    assert limiter.queued == 1
+
+    limiter.release(0.1)
+    waiter.join()
+    assert results == [True]
+    assert limiter.in_flight == 1
+    assert limiter.queued == 0
+
+
+def test_rate_limited_response_has_retry_after():
+    controller = AdmissionController({'work': (4, 4)}, rate=0.5, burst=1, queue_timeout=1)
+    client = make_app(controller).test_client()
+
+    assert client.post('/work').status_code == 200
+    response = client.post('/work')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    assert response.json['retry_after'] == 2
+
+
+def test_shed_response_has_retry_after():
+    controller = AdmissionController({'work': (1, 1)}, rate=100, burst=100, queue_timeout=1)
+    limiter = controller.limiters['work']
+    limiter.avg_service_time = 3.0
+    assert limiter.acquire(time.monotonic() + 1)
+
+    response = make_app(controller).test_client().post('/work')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert controller.saturated()
+
+
+def test_forwarded_for_does_not_bypass_rate_limit():
+    controller = AdmissionController({'work': (4, 4)}, rate=0.01, burst=1, queue_timeout=1)
+    client = make_app(controller).test_client()
+
+    statuses = [
+        client.post('/work', headers={'X-Forwarded-For': f'9.9.9.{i}, 1.1.1.1'}).status_code
+        for i in range(5)
+    ]
+    assert statuses == [200, 429, 429, 429, 429]
+
+
+def test_from_env_rejects_limits_beyond_thread_budget(monkeypatch):
+    monkeypatch.setenv('WORKER_THREADS', '8')
+    monkeypatch.setenv('ADMISSION_MAX_QUEUE', '32')
+    with pytest.raises(ValueError):
+        AdmissionController.from_env()
+
+
+def test_from_env_defaults_fit_thread_budget(monkeypatch):
+    monkeypatch.setenv('WORKER_THREADS', '32')
+    controller = AdmissionController.from_env()
+    used = sum(l.max_concurrent + l.max_queue for l in controller.limiters.values())
+    assert used <= 30
+
+
+def test_empty_queue_without_queueing_is_not_saturated():
+    controller = AdmissionController({'work': (1, 0)}, rate=1, burst=1, queue_timeout=1)
+    assert not controller.saturated()
@@ -0,0 +1,79 @@
+"""
+Tests for traffic capture and replay helpers - run with: python -m pytest test_capture.py
+"""
+
+import json
+
+import pytest
+
+from capture import TrafficRecorder, load_entries, response_hash
+from replay import replay_speed, sample_rate
+
+
+def entry(ts, **fields):
+    return dict({'ts': ts, 'method': 'POST', 'path': '/api/checkout', 'body': {}}, **fields)
+
+
+def first_ts(path):
+    with open(path, encoding='utf-8') as f:
+        return json.loads(f.readline())['ts']
+
+
+def test_rotation_keeps_newest_backups_in_order(tmp_path):
+    path = tmp_path / 'traffic.jsonl'
+    line_size = len(json.dumps(entry(0), separators=(',', ':'))) + 1
+    recorder = TrafficRecorder(str(path), max_bytes=line_size, backups=2)
+
+    for ts in range(4):
+        recorder.record(entry(ts))
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['traffic.jsonl', 'traffic.jsonl.1', 'traffic.jsonl.2']
+    assert first_ts(path) == 3
+    assert first_ts(f"{path}.1") == 2
+    assert first_ts(f"{path}.2") == 1
+    assert [e['ts'] for e in load_entries([f"{path}.2", str(path), f"{path}.1"])] == [1, 2, 3]
+
+
+def test_rotation_without_backups_starts_over(tmp_path):
+    path = tmp_path / 'traffic.jsonl'
+    line_size = len(json.dumps(entry(0), separators=(',', ':'))) + 1
+    recorder = TrafficRecorder(str(path), max_bytes=line_size, backups=0)
+
+    for ts in range(3):
+        recorder.record(entry(ts))
+
+    assert [p.name for p in tmp_path.iterdir()] == ['traffic.jsonl']
+    assert first_ts(path) == 2
+
+
+def test_response_hash_ignores_volatile_keys():
+    recorded = {'total': 300, 'items': [{'id': 'j1', 'latest_delivery_date': '2026-01-01'}], 'date': 'Mon'}
+    replayed = {'items': [{'latest_delivery_date': '2026-03-05', 'id': 'j1'}], 'date': 'Thu', 'total': 300}
+
+    assert response_hash(recorded) == response_hash(replayed)
+    assert response_hash(recorded) != response_hash(dict(recorded, total=301))
+
+
+def test_client_key_is_keyed_and_stable(tmp_path):
+    recorder = TrafficRecorder(str(tmp_path / 'traffic.jsonl'), salt='one')
+
+    assert recorder.client_key('10.0.0.1') == recorder.client_key('10.0.0.1')
+    assert recorder.client_key('10.0.0.1') != recorder.client_key('10.0.0.2')
+    other = TrafficRecorder(str(tmp_path / 'traffic.jsonl'), salt='two')
+    assert other.client_key('10.0.0.1') != recorder.client_key('10.0.0.1')
+
+
+@pytest.mark.parametrize('rates, speed, captured_rate, expected', [
+    ([0.1, 0.1], 1, False, 10),
+    ([0.1, 0.1], 2, False, 20),
+    ([0.1, 0.1], 2, True, 2),
+    ([0.5, None], 1, False, 1 / 0.75),
+    ([None, None], 3, False, 3)
+])
+def test_replay_speed_rebuilds_production_rate(rates, speed, captured_rate, expected):
+    entries = [entry(i) if rate is None else entry(i, sample_rate=rate) for i, rate in enumerate(rates)]
+    assert replay_speed(entries, speed, captured_rate) == pytest.approx(expected)
+
+
+def test_sample_rate_defaults_old_entries_to_one():
+    assert sample_rate([entry(0), entry(1, sample_rate=0.5)]) == 0.75
@@ -0,0 +1,179 @@
+"""
+Tests for live catalog feeds - run with: python -m pytest test_feeds.py
+"""
+
+import json
+import time
+
+import pytest
+
+from feeds import CatalogStore, FeedIngestor, FileTailSource
+
+
+RETAILERS = {
+    'rei': {'name': 'REI', 'base_delivery': 3},
+    'evo': {'name': 'Evo', 'base_delivery': 4}
+}
+
+PRODUCTS = {
+    'jacket': [
+        {'id': 'j1', 'name': 'Jacket One', 'price': 100, 'retailer': 'rei', 'rating': 4.5},
+        {'id': 'j2', 'name': 'Jacket Two', 'price': 120, 'retailer': 'evo', 'rating': 4.0}
+    ],
+    'gloves': [
+        {'id': 'g1', 'name': 'Gloves One', 'price': 40, 'retailer': 'evo', 'rating': 4.2}
+    ]
+}
+
+SPEC = {'budget': 400, 'delivery_days': 5, 'preferences': {}}
+
+
+def counting_rank(calls):
+    def rank(products, spec):
+        calls.append([p['id'] for p in products])
+        return sorted(products, key=lambda p: p['price'])
+    return rank
+
+
+def test_old_snapshot_is_untouched_by_updates():
+    store = CatalogStore(RETAILERS, PRODUCTS)
+    old = store.current
+
+    assert store.apply([{'id': 'j1', 'price': 90}]) == (1, 0)
+    new = store.current
+
+    assert new.version == old.version + 1
+    assert old.products['jacket'][0]['price'] == 100
+    assert new.products['jacket'][0]['price'] == 90
+    # Only the touched category and product are copied
+    assert new.products['gloves'] is old.products['gloves']
+    assert new.products['jacket'] is not old.products['jacket']
+    assert new.products['jacket'][1] is old.products['jacket'][1]
+    assert new.index is old.index
+
+
+def test_retailer_update_bumps_only_its_categories():
+    store = CatalogStore(RETAILERS, PRODUCTS)
+    old = store.current
+
+    store.apply([{'retailer': 'rei', 'base_delivery': 1}])
+    new = store.current
+
+    assert old.retailers['rei']['base_delivery'] == 3
+    assert new.retailers['rei']['base_delivery'] == 1
+    assert new.category_versions == {'jacket': 2, 'gloves': 1}
+
+
+def test_rank_cache_invalidates_per_category():
+    store = CatalogStore(RETAILERS, PRODUCTS)
+    calls = []
+    rank = counting_rank(calls)
+
+    for category in ('jacket', 'gloves'):
+        store.rank_cache.get_or_rank(store.current, category, SPEC, rank)
+    assert len(calls) == 2
+
+    store.apply([{'id': 'j2', 'in_stock': False}])
+
+    store.rank_cache.get_or_rank(store.current, 'gloves', SPEC, rank)
+    assert len(calls) == 2
+
+    ranked = store.rank_cache.get_or_rank(store.current, 'jacket', SPEC, rank)
+    assert len(calls) == 3
+    assert [p['id'] for p in ranked] == ['j1']
+
+
+def test_rank_cache_keys_on_spec():
+    store = CatalogStore(RETAILERS, PRODUCTS)
+    calls = []
+    rank = counting_rank(calls)
+
+    store.rank_cache.get_or_rank(store.current, 'jacket', SPEC, rank)
+    store.rank_cache.get_or_rank(store.current, 'jacket', dict(SPEC, budget=100), rank)
+    store.rank_cache.get_or_rank(store.current, 'jacket', SPEC, rank)
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize('update', [
+    {'id': 'j1', 'price': float('nan')},
+    {'id': 'j1', 'price': float('inf')},
+    {'id': 'j1', 'price': 0},
+    {'id': 'j1', 'price': 1e12},
+    {'id': 'j1', 'price': 10 ** 400},
+    {'id': 'j1', 'price': True},
+    {'id': 'j1', 'rating': 5.5},
+    {'id': 'j1', 'in_stock': 'no'},
+    {'retailer': 'rei', 'base_delivery': 1e12},
+    {'retailer': 'rei', 'base_delivery': 2.5},
+    {'retailer': 'rei', 'base_delivery': -1},
+    {'id': 'missing', 'price': 10},
+    {'id': 'j1', 'name': 'Renamed'},
+    ['not', 'an', 'object']
+])
+def test_invalid_updates_are_skipped(update):
+    store = CatalogStore(RETAILERS, PRODUCTS)
+    old = store.current
+
+    assert store.apply([update]) == (0, 1)
+    assert store.current is old
+
+
+def test_batch_applies_valid_updates_as_one_version():
+    store = CatalogStore(RETAILERS, PRODUCTS)
+
+    applied, skipped = store.apply([
+        {'id': 'j1', 'price': 95},
+        {'id': 'j1', 'price': float('nan')},
+        {'id': 'g1', 'rating': 4.9}
+    ])
+
+    assert (applied, skipped) == (2, 1)
+    assert store.current.version == 2
+    assert store.current.products['jacket'][0]['price'] == 95
+    assert store.current.products['gloves'][0]['rating'] == 4.9
+
+
+def test_file_feed_is_applied(tmp_path):
+    feed = tmp_path / 'feed.jsonl'
+    feed.write_text(json.dumps({'id': 'g1', 'price': 35}) + '\n' + 'not json\n')
+
+    store = CatalogStore(RETAILERS, PRODUCTS)
+    ingestor = FeedIngestor(store, FileTailSource(str(feed), poll_interval=0.05), batch_interval=0.05)
+    ingestor.start()
+    try:
+        deadline = time.monotonic() + 2
+        while store.current.version == 1 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        ingestor.stop()
+
+    assert store.current.products['gloves'][0]['price'] == 35
+    assert ingestor.status()['applied'] == 1
+    assert ingestor.status()['skipped'] == 1
+
+
+def test_bad_feed_lines_do_not_stop_ingestion(tmp_path):
+    feed = tmp_path / 'feed.jsonl'
+    feed.write_bytes(
+        b'{"id": "j1", "price": ' + b'9' * 400 + b'}\n'
+        + b'{"id": "j1", "price": ' + b'9' * 5000 + b'}\n'
+        + b'{"id": "j1", "name": "\xff\xfe"}\n'
+        + json.dumps({'id': 'g1', 'price': 35}).encode() + b'\n'
+    )
+
+    store = CatalogStore(RETAILERS, PRODUCTS)
+    ingestor = FeedIngestor(store, FileTailSource(str(feed), poll_interval=0.05), batch_interval=0.05)
+    ingestor.start()
+    try:
+        deadline = time.monotonic() + 2
+        while store.current.version == 1 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        status = ingestor.status()
+    finally:
+        ingestor.stop()
+
+    assert store.current.products['gloves'][0]['price'] == 35
+    assert store.current.products['jacket'][0]['price'] == 100
+    assert status['running']
+    assert status['error'] is None
+    assert (status['applied'], status['skipped']) == (1, 3)
@@ -0,0 +1,72 @@
+"""
+Tests for Gemini request helpers - run with: python -m pytest test_gemini.py
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from gemini import CHARS_PER_TOKEN, GeminiUsage, generation_config, truncate_brief
+
+
+BRIEF = 'Ski trip for two. ' + 'We like bright colours and good reviews. ' * 40 + 'Budget $500, within 3 days'
+
+
+def test_short_brief_is_unchanged():
+    assert truncate_brief('Skiing, budget $400', 500) == ('Skiing, budget $400', False)
+
+
+@pytest.mark.parametrize('max_tokens', [1, 2, 3, 10, 50, 200])
+def test_truncated_brief_fits_budget(max_tokens):
+    text, truncated = truncate_brief(BRIEF, max_tokens)
+    assert truncated
+    assert len(text) <= max_tokens * CHARS_PER_TOKEN
+
+
+def test_truncation_keeps_start_and_end():
+    text, _ = truncate_brief(BRIEF, 50)
+    assert text.startswith('Ski trip for two.')
+    assert text.endswith('within 3 days')
+    assert ' ... ' in text
+
+
+def test_budget_of_one_token_keeps_the_start():
+    assert truncate_brief(BRIEF, 1) == (BRIEF[:CHARS_PER_TOKEN], True)
+
+
+@pytest.mark.parametrize('max_tokens', [0, -1])
+def test_non_positive_budget_is_rejected(max_tokens):
+    with pytest.raises(ValueError):
+        truncate_brief(BRIEF, max_tokens)
+
+
+def test_generation_config_caps_output_and_limits_items():
+    config = generation_config(['jacket', 'gloves'], 128)
+    assert config['max_output_tokens'] == 128
+    assert config['response_mime_type'] == 'application/json'
+    assert config['response_schema']['properties']['items']['items']['enum'] == ['jacket', 'gloves']
+
+
+def test_usage_totals_token_counts():
+    usage = GeminiUsage()
+    response = SimpleNamespace(usage_metadata=SimpleNamespace(prompt_token_count=120, candidates_token_count=30))
+    usage.record(100, response)
+    usage.record(300, response, truncated=True)
+
+    snapshot = usage.snapshot()
+    assert snapshot['calls'] == 2
+    assert snapshot['prompt_tokens'] == 240
+    assert snapshot['output_tokens'] == 60
+    assert snapshot['truncated'] == 1
+    assert snapshot['avg_latency_ms'] == 200
+
+
+def test_usage_without_metadata_counts_zero_tokens():
+    usage = GeminiUsage()
+    assert usage.record(50, SimpleNamespace(text='{}'))['prompt_tokens'] == 0
+    call = usage.record(80, None, failed=True)
+
+    assert call == {'latency_ms': 80, 'prompt_tokens': 0, 'output_tokens': 0, 'truncated': False, 'failed': True}
+    snapshot = usage.snapshot()
+    assert (snapshot['calls'], snapshot['failures'], snapshot['prompt_tokens']) == (2, 1, 0)
+    assert snapshot['last_call'] == call
@@ -0,0 +1,96 @@
+"""
+Tests for the sampling profiler - run with: python -m pytest test_profiler.py
+"""
+
+import time
+
+import pytest
+
+from profiler import SamplingProfiler
+
+
+@pytest.fixture
+def profiler():
+    profiler = SamplingProfiler(buffer_size=5)
+    yield profiler
+    profiler.stop()
+
+
+def request_info(elapsed_ms):
+    return {'method': 'POST', 'path': '/api/checkout', 'status': 200, 'elapsed_ms': elapsed_ms}
+
+
+def test_slow_request_mode_keeps_only_requests_over_threshold(profiler):
+    profiler.start(seconds=5, threshold_ms=100, interval_ms=1)
+
+    profiler.begin_request()
+    profiler.end_request(request_info(50))
+    assert profiler.snapshot() == []
+
+    profiler.begin_request()
+    time.sleep(0.05)
+    profiler.end_request(request_info(150))
+
+    [capture] = profiler.snapshot()
+    assert capture['kind'] == 'slow_request'
+    assert capture['elapsed_ms'] == 150
+    assert any('test_profiler.py:' in stack for stack in capture['stacks'])
+    assert profiler.requests == {}
+
+
+def test_requests_not_begun_are_not_captured(profiler):
+    profiler.start(seconds=5, threshold_ms=0)
+    profiler.end_request(request_info(500))
+    assert profiler.snapshot() == []
+
+
+def test_begin_request_is_ignored_when_disarmed(profiler):
+    profiler.begin_request()
+    assert profiler.requests == {}
+
+    profiler.start(seconds=5)
+    profiler.begin_request()
+    assert profiler.requests == {}
+
+
+def test_discard_request_stops_sampling_the_thread(profiler):
+    profiler.start(seconds=5, threshold_ms=0)
+    profiler.begin_request()
+    assert len(profiler.requests) == 1
+
+    profiler.discard_request()
+    assert profiler.requests == {}
+    profiler.end_request(request_info(500))
+    assert profiler.snapshot() == []
+    # Safe to call when nothing was begun
+    profiler.discard_request()
+
+
+def test_window_mode_captures_on_stop(profiler):
+    profiler.start(seconds=5, interval_ms=1)
+    time.sleep(0.05)
+    profiler.stop()
+
+    [capture] = profiler.snapshot()
+    assert capture['kind'] == 'window'
+    assert capture['samples'] > 0
+    assert any(stack.endswith('test_profiler.py:test_window_mode_captures_on_stop') for stack in capture['stacks'])
+    assert not profiler.status()['active']
+
+
+def test_start_while_running_is_rejected(profiler):
+    profiler.start(seconds=5)
+    with pytest.raises(RuntimeError):
+        profiler.start(seconds=5)
+
+
+def test_collapsed_merges_captures_most_common_first(profiler):
+    profiler.captures.extend([
+        {'kind': 'window', 'stacks': {'app.py:a;app.py:b': 2, 'app.py:a': 1}},
+        {'kind': 'slow_request', 'stacks': {'app.py:a;app.py:b': 3, 'app.py:c': 4}}
+    ])
+
+    assert profiler.collapsed() == 'app.py:a;app.py:b 5\napp.py:c 4\napp.py:a 1\n'
+
+    profiler.clear()
+    assert profiler.collapsed() == ''